@@ -1,23 +1,28 @@
 # pipeline.py
-import os, json, re, time, random
+import os, json, re, time, random, csv, sqlite3, contextlib
+import regex
+import orjson
 from datetime import datetime
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 import requests
-from PIL import Image
-import pytesseract
+import cv2
+from pytessy import PyTessy
 from urllib.parse import urlencode
 from tqdm import tqdm
-import pandas as pd
+import ahocorasick
 
 cfg = json.load(open("config.json", "r", encoding="utf-8"))
 OUT_DIR = cfg.get("output_dir", "output")
 IMAGES_DIR = os.path.join(OUT_DIR, "images")
 RAW_PATH = os.path.join(OUT_DIR, "posts_with_images.json")
 GEOJSON_OUT = os.path.join(OUT_DIR, "coffee_geo.json")
+GEO_CACHE_PATH = os.path.join(OUT_DIR, "geo_cache.db")
 CUTOFF_DAYS = int(cfg.get("cutoff_days", 365*3))
 
 # --- helper: simple address regex for Taiwan (very heuristic) ---
-ADDRESS_PATTERN = re.compile(r'((台灣|台北市|台中市|台南市|高雄市|新北市|桃園市|台中|台北|高雄|新北|南投縣|苗栗縣|台南縣|屏東縣|宜蘭縣|基隆市|彰化縣|嘉義市|嘉義縣|雲林縣|新竹市|新竹縣).{2,80}?\d{1,4}號?)', re.I)
+# longest-alternative-first region prefix; the body is atomic (any run up to the first digit) so near-misses fail without backtracking
+ADDRESS_PATTERN = regex.compile(r'((?:台(?:灣|北市?|中市?|南[市縣])|高雄市?|新北市?|桃園市|基隆市|新竹[市縣]|嘉義[市縣]|南投縣|苗栗縣|屏東縣|宜蘭縣|彰化縣|雲林縣)(?>.{2}[^\d\n]{0,78})\d{1,4}號?)', regex.I)
 
 # example store keywords for tags/attrs - you can expand this list
 TAG_KEYWORDS = {
@@ -30,28 +35,52 @@ TAG_KEYWORDS = {
     "night_open": ["深夜","營業到","凌晨","夜貓"]
 }
 
+# all keywords of all categories in one automaton -> a single pass over the text per post;
+# each keyword maps to the set of categories listing it, so shared keywords hit every category
+TAG_AUTOMATON = ahocorasick.Automaton()
+for _k, _kws in TAG_KEYWORDS.items():
+    for _kw in _kws:
+        _cats = TAG_AUTOMATON.get(_kw.lower(), set())
+        _cats.add(_k)
+        TAG_AUTOMATON.add_word(_kw.lower(), _cats)
+TAG_AUTOMATON.make_automaton()
+
+# one in-process libtesseract handle per (worker) process, keeps the language model loaded across calls;
+# created lazily inside ocr_image's try so a missing libtesseract / traineddata just yields empty OCR text
+_ocr = None
+
+def init_ocr():
+    global _ocr
+    if _ocr is None:
+        _ocr = PyTessy(language="chi_sim+eng")
+
 def ocr_image(img_path):
     try:
         full = os.path.join(OUT_DIR, img_path)
         if not os.path.exists(full):
             return ""
-        txt = pytesseract.image_to_string(Image.open(full), lang="chi_sim+eng")
-        return txt
+        init_ocr()
+        # grayscale + Otsu binarization: cleaner text for tesseract and 1/3 of the pixel data
+        img = cv2.imread(full, cv2.IMREAD_GRAYSCALE)
+        if img is None:
+            return ""
+        img = cv2.medianBlur(img, 3)  # FB screenshots are often jpeg-noisy
+        _, bw = cv2.threshold(img, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+        # hand the uint8 array straight to libtesseract (1 byte per pixel), no PIL / temp-file round-trip
+        h, w = bw.shape
+        txt = _ocr.read(bw.tobytes(), w, h, 1, raw=True)
+        return txt.decode("utf-8", "ignore") if txt else ""
     except Exception as e:
         return ""
 
 def extract_address(text, images_text=""):
-    # try regex first
-    addr_candidates = []
-    for m in ADDRESS_PATTERN.findall(text):
-        addr_candidates.append(m[0])
+    # first match wins: try the post text, and only scan OCR text when that misses
+    m = ADDRESS_PATTERN.search(text)
+    if m:
+        return m.group(1)
     # from OCR text
-    for m in ADDRESS_PATTERN.findall(images_text):
-        addr_candidates.append(m[0])
-    # dedupe
-    if addr_candidates:
-        return addr_candidates[0]
-    return None
+    m = ADDRESS_PATTERN.search(images_text)
+    return m.group(1) if m else None
 
 def extract_name(text):
     # heuristics:
@@ -83,13 +112,12 @@ def infer_tags_attrs(text, images_text=""):
         "night_open": None
     }
     full_text = (text + "\n" + images_text).lower()
-    for k, kws in TAG_KEYWORDS.items():
-        for kw in kws:
-            if kw.lower() in full_text:
-                if k in ["breakfast","meal","socket","pet","roastery","dessert","night_open"]:
-                    attrs[k] = True
-                else:
-                    tags.add(k)
+    matched = set().union(*(cats for _, cats in TAG_AUTOMATON.iter(full_text)))
+    for k in matched:
+        if k in ["breakfast","meal","socket","pet","roastery","dessert","night_open"]:
+            attrs[k] = True
+        else:
+            tags.add(k)
     # seat inference
     if any(w in full_text for w in ["座位少","座位不多","外帶為主","外帶"]):
         attrs["seat"] = "少"
@@ -118,99 +146,147 @@ def geocode_nominatim(address, email):
         return float(j[0]["lon"]), float(j[0]["lat"]), j[0].get("display_name")
     return None
 
+def open_geo_cache():
+    # persistent address -> (lon, lat, formatted address) cache so reruns skip the API + rate limit sleep
+    cache = sqlite3.connect(GEO_CACHE_PATH)
+    cache.execute("CREATE TABLE IF NOT EXISTS g(addr TEXT PRIMARY KEY, lon REAL, lat REAL, fmt TEXT)")
+    return cache
+
+def build_feature(p, text_address, ocr_texts, geo_cache, feat_id):
+    "One post -> GeoJSON feature: name / address (OCR text as fallback), geocode, tags & attrs."
+    text = p.get("text","")
+    dt = p.get("datetime")
+    if dt is None:
+        # skip if no time
+        pass
+
+    # OCR images text aggregation (only for posts whose caption had no address)
+    address = text_address
+    if address:
+        images_text = ""
+    else:
+        images_text = "".join(txt + "\n" for txt in ocr_texts)
+        address = extract_address(text, images_text)
+
+    name = extract_name(text + "\n" + images_text)
+
+    # if no address, leave None (we decided behavior 2 -> mark no_location)
+    coords = None
+    formatted_addr = None
+    if address:
+        cached = geo_cache.execute("SELECT lon, lat, fmt FROM g WHERE addr = ?", (address,)).fetchone()
+        if cached:
+            coords = [cached[0], cached[1]]
+            formatted_addr = cached[2]
+    if address and not coords:
+        # try google first
+        if cfg.get("use_google_geocode") and cfg.get("google_api_key"):
+            try:
+                out = geocode_address_google(address, cfg["google_api_key"])
+                if out:
+                    coords = [out[0], out[1]]
+                    formatted_addr = out[2]
+            except Exception:
+                coords = None
+        # fallback to nominatim
+        if not coords:
+            try:
+                out = geocode_nominatim(address, cfg.get("nominatim_email", ""))
+                if out:
+                    coords = [out[0], out[1]]
+                    formatted_addr = out[2]
+            except Exception:
+                coords = None
+        time.sleep(1 + random.random()*0.5)  # rate limit friendly
+        if coords:
+            geo_cache.execute("INSERT OR REPLACE INTO g VALUES (?, ?, ?, ?)",
+                              (address, coords[0], coords[1], formatted_addr))
+            geo_cache.commit()
+
+    # images_text is empty when the caption already held the address, so this is text-only then
+    tags, attrs = infer_tags_attrs(text, images_text)
+
+    # ensure seat key exists
+    if attrs.get("seat") is None:
+        attrs["seat"] = None
+
+    feat = {
+        "type":"Feature",
+        "geometry": {"type":"Point", "coordinates": coords if coords else [0,0]},
+        "properties": {
+            "id": feat_id,
+            "name": name if name else None,
+            "intro": (text[:400] if text else None),
+            "address": formatted_addr if formatted_addr else (address if address else None),
+            "closed_day": None,
+            "tags": tags,
+            "thumb": p.get("saved_images",[None])[0] if p.get("saved_images") else None,
+            "attrs": attrs,
+            "source": p.get("permalink"),
+            "post_datetime": dt
+        }
+    }
+
+    # mark no_location if no coords found but there is some hint
+    if not coords:
+        feat["properties"]["no_location"] = True
+
+    return feat
+
 def run():
     raw = json.load(open(RAW_PATH, "r", encoding="utf-8"))
     features = []
     id_counter = 1000
-    results_for_review = []
-
-    for p in tqdm(raw):
-        text = p.get("text","")
-        dt = p.get("datetime")
-        if dt is None:
-            # skip if no time
-            pass
 
-        # OCR images text aggregation (for cases where screenshot holds address)
-        images_text = ""
-        for img in p.get("saved_images", []):
-            images_text += ocr_image(img) + "\n"
+    # most posts carry the address in the caption; only those without one need OCR
+    text_addresses = [extract_address(p.get("text",""), "") for p in raw]
 
-        name = extract_name(text + "\n" + images_text)
-        address = extract_address(text, images_text)
+    # OCR all images of all posts in one batch; tesseract is CPU-bound so spread it over every core
+    ocr_tasks = [(post_idx, img_idx, img)
+                 for post_idx, p in enumerate(raw) if not text_addresses[post_idx]
+                 for img_idx, img in enumerate(p.get("saved_images", []))]
+    ocr_results = defaultdict(list)
+    with ProcessPoolExecutor(max_workers=os.cpu_count()) as executor:
+        ocred = executor.map(ocr_image, [t[2] for t in ocr_tasks], chunksize=4)
+        for (post_idx, img_idx, _), txt in zip(ocr_tasks, ocred):
+            ocr_results[post_idx].append(txt)
 
-        # if no address, leave None (we decided behavior 2 -> mark no_location)
-        coords = None
-        formatted_addr = None
-        if address:
-            # try google first
-            if cfg.get("use_google_geocode") and cfg.get("google_api_key"):
-                try:
-                    out = geocode_address_google(address, cfg["google_api_key"])
-                    if out:
-                        coords = [out[0], out[1]]
-                        formatted_addr = out[2]
-                except Exception:
-                    coords = None
-            # fallback to nominatim
-            if not coords:
-                try:
-                    out = geocode_nominatim(address, cfg.get("nominatim_email", ""))
-                    if out:
-                        coords = [out[0], out[1]]
-                        formatted_addr = out[2]
-                except Exception:
-                    coords = None
-            time.sleep(1 + random.random()*0.5)  # rate limit friendly
-
-        tags, attrs = infer_tags_attrs(text, images_text)
-
-        # ensure seat key exists
-        if attrs.get("seat") is None:
-            attrs["seat"] = None
-
-        feat = {
-            "type":"Feature",
-            "geometry": {"type":"Point", "coordinates": coords if coords else [0,0]},
-            "properties": {
-                "id": id_counter,
-                "name": name if name else None,
-                "intro": (text[:400] if text else None),
-                "address": formatted_addr if formatted_addr else (address if address else None),
-                "closed_day": None,
-                "tags": tags,
-                "thumb": p.get("saved_images",[None])[0] if p.get("saved_images") else None,
-                "attrs": attrs,
-                "source": p.get("permalink"),
-                "post_datetime": dt
-            }
-        }
-        id_counter += 1
+    # review CSV is streamed row by row instead of collected into a DataFrame at the end;
+    # it goes to a temp file that only replaces review_candidates.csv once the run succeeded
+    review_csv = os.path.join(OUT_DIR, "review_candidates.csv")
+    review_tmp = review_csv + ".tmp"
+    geo_cache = open_geo_cache()
+    try:
+        with open(review_tmp, "w", encoding="utf-8-sig", newline="") as review_f:
+            review_writer = csv.DictWriter(review_f, fieldnames=["id", "name", "address_candidate", "coords", "thumb", "post"])
+            review_writer.writeheader()
+            for post_idx, p in enumerate(tqdm(raw)):
+                feat = build_feature(p, text_addresses[post_idx], ocr_results[post_idx], geo_cache, id_counter)
+                id_counter += 1
+                features.append(feat)
+                # add minimal row for review
+                review_writer.writerow({
+                    "id": feat["properties"]["id"],
+                    "name": feat["properties"]["name"],
+                    "address_candidate": feat["properties"]["address"],
+                    "coords": feat["geometry"]["coordinates"],
+                    "thumb": feat["properties"]["thumb"],
+                    "post": feat["properties"]["source"]
+                })
 
-        # mark no_location if no coords found but there is some hint
-        if not coords:
-            feat["properties"]["no_location"] = True
-
-        features.append(feat)
-        # add minimal row for review
-        results_for_review.append({
-            "id": feat["properties"]["id"],
-            "name": feat["properties"]["name"],
-            "address_candidate": feat["properties"]["address"],
-            "coords": feat["geometry"]["coordinates"],
-            "thumb": feat["properties"]["thumb"],
-            "post": feat["properties"]["source"]
-        })
-
-    # write geojson
-    geo = {"type":"FeatureCollection", "features": features}
-    with open(GEOJSON_OUT, "w", encoding="utf-8") as f:
-        json.dump(geo, f, ensure_ascii=False, indent=2)
+        # write geojson
+        geo = {"type":"FeatureCollection", "features": features}
+        with open(GEOJSON_OUT, "wb") as f:
+            f.write(orjson.dumps(geo, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(review_tmp)
+        raise
+    finally:
+        geo_cache.close()
 
     # write review CSV for manual verification
-    df = pd.DataFrame(results_for_review)
-    review_csv = os.path.join(OUT_DIR, "review_candidates.csv")
-    df.to_csv(review_csv, index=False, encoding="utf-8-sig")
+    os.replace(review_tmp, review_csv)
 
     print("Done. GeoJSON:", GEOJSON_OUT, "Review CSV:", review_csv)
 
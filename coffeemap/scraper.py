@@ -1,5 +1,5 @@
 # scraper.py
-import os, time, json, random, re
+import os, time, json, random, re, hashlib, shutil
 from datetime import datetime, timedelta
 from urllib.parse import urlparse, parse_qs
 from selenium import webdriver
@@ -8,6 +8,8 @@ from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.common.by import By
 from bs4 import BeautifulSoup
 import requests
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor
 from dateutil import parser as dateparser
 from tqdm import tqdm
 
@@ -28,6 +30,16 @@ CUTOFF_DAYS = int(cfg.get("cutoff_days", 365*3))
 
 cutoff_dt = datetime.now() - timedelta(days=CUTOFF_DAYS)
 
+# post id patterns, compiled once for the per-article loop in get_posts
+_POST_RE = re.compile(r'/posts/(\d+)')
+_TLPI_RE = re.compile(r'"top_level_post_id":"(\d+)"')
+
+# shared session for image downloads: pooled keep-alive connections across worker threads
+DOWNLOAD_WORKERS = cfg.get("download_workers", 32)
+sess = requests.Session()
+sess.mount("https://", HTTPAdapter(pool_connections=DOWNLOAD_WORKERS, pool_maxsize=DOWNLOAD_WORKERS))
+sess.mount("http://", HTTPAdapter(pool_connections=DOWNLOAD_WORKERS, pool_maxsize=DOWNLOAD_WORKERS))
+
 def setup_driver(headless=True):
     options = Options()
     if headless:
@@ -58,14 +70,14 @@ def parse_time_from_element(el):
 
 def download_img(url, post_id, idx):
     try:
-        resp = requests.get(url, stream=True, timeout=20)
+        resp = sess.get(url, stream=True, timeout=20)
         resp.raise_for_status()
+        resp.raw.decode_content = True  # let urllib3 undo any gzip/deflate transfer encoding
         ext = ".jpg"
         fname = f"{post_id}-{idx}{ext}"
         fpath = os.path.join(IMAGES_DIR, fname)
         with open(fpath, "wb") as f:
-            for chunk in resp.iter_content(10240):
-                f.write(chunk)
+            shutil.copyfileobj(resp.raw, f, 1 << 20)
         return os.path.relpath(fpath, OUT_DIR)
     except Exception as e:
         print("下載圖片失敗:", e)
@@ -77,6 +89,8 @@ def get_posts(driver):
 
     # scroll and collect html snapshots until cutoff or max scrolls
     posts = {}
+    # cheap per-article keys (id in the first /posts/ anchor) of articles already processed
+    seen_keys = set()
     last_height = driver.execute_script("return document.body.scrollHeight")
     scrolls = 0
     while scrolls < MAX_SCROLLS:
@@ -88,12 +102,12 @@ def get_posts(driver):
         # FB structure is complex: look for article tags or div[role='article']
         for art in soup.find_all(["article", "div"], attrs={"role":"article"}):
             try:
-                # extract text
-                text_el = art.find(lambda tag: tag.name in ["div","span"] and tag.get("data-ad-preview")=="message")
-                if not text_el:
-                    # fallback: get long text
-                    text_el = art.find("div", recursive=True)
-                text = text_el.get_text(separator="\n").strip() if text_el else ""
+                # page_source holds every article loaded so far; skip ones already processed on a
+                # cheap anchor lookup, before str(art) / text / time / image walks over the subtree
+                post_a = art.find("a", href=_POST_RE)
+                seen_key = _POST_RE.search(post_a["href"]).group(1) if post_a else None
+                if seen_key and seen_key in seen_keys:
+                    continue
 
                 # permalink / post id detection
                 permalink = None
@@ -105,15 +119,27 @@ def get_posts(driver):
                     if "/posts/" in href or "/permalink/" in href:
                         permalink = href
                         # try extract id
-                        m = re.search(r'/posts/(\d+)', href)
+                        m = _POST_RE.search(href)
                         if m:
                             post_id = m.group(1)
                 # fallback: look for data-ft or data-testid attributes
                 if not post_id:
-                    m2 = re.search(r'"top_level_post_id":"(\d+)"', str(art))
+                    m2 = _TLPI_RE.search(str(art))
                     if m2:
                         post_id = m2.group(1)
 
+                if post_id and post_id in posts:
+                    if seen_key:
+                        seen_keys.add(seen_key)
+                    continue
+
+                # extract text
+                text_el = art.find(lambda tag: tag.name in ["div","span"] and tag.get("data-ad-preview")=="message")
+                if not text_el:
+                    # fallback: get long text
+                    text_el = art.find("div", recursive=True)
+                text = text_el.get_text(separator="\n").strip() if text_el else ""
+
                 # get time
                 dt = parse_time_from_element(art)
                 if dt and dt < cutoff_dt:
@@ -128,8 +154,8 @@ def get_posts(driver):
                     if src and "scontent" in src or src:
                         images.append(src)
 
-                # dedupe by text+permalink
-                key = post_id or (text[:120] + (permalink or ""))
+                # dedupe by text+permalink (16-byte sha256 digest keeps keys small and fixed-size)
+                key = post_id or hashlib.sha256((text[:120] + (permalink or "")).encode()).digest()[:16]
                 if key not in posts:
                     posts[key] = {
                         "post_id": post_id,
@@ -138,6 +164,8 @@ def get_posts(driver):
                         "datetime": dt.isoformat() if dt else None,
                         "images": images
                     }
+                if seen_key:
+                    seen_keys.add(seen_key)
             except Exception as e:
                 continue
 
@@ -162,15 +190,20 @@ def main():
 
     print(f"抓到 {len(posts)} 篇貼文，已儲存到 {raw_path}")
 
-    # download images (optional)
-    for p in posts.values():
-        pid = p.get("post_id") or str(abs(hash(p.get("text",""))))[:12]
-        saved = []
+    # download images (optional), all posts' images concurrently
+    tasks = []
+    for key, p in posts.items():
+        # posts keys are unique (post_id or the sha256 dedupe digest), so file names can't collide
+        # between concurrent downloads the way hash(text) could for posts with identical text
+        pid = p.get("post_id") or key.hex()
+        p["saved_images"] = []
         for idx, url in enumerate(p.get("images",[])):
-            rel = download_img(url, pid, idx)
+            tasks.append((p, url, pid, idx))
+    with ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS) as ex:
+        # map keeps task order, so each post's saved_images stays in image order
+        for (p, _, _, _), rel in zip(tasks, ex.map(lambda t: download_img(*t[1:]), tasks)):
             if rel:
-                saved.append(rel)
-        p["saved_images"] = saved
+                p["saved_images"].append(rel)
 
     with open(os.path.join(OUT_DIR, "posts_with_images.json"), "w", encoding="utf-8") as f:
         json.dump(list(posts.values()), f, ensure_ascii=False, indent=2)
@@ -1,6 +1,8 @@
 #  crontab -e
 #  00 12 * * * /usr/bin/python3 /..path/daily_crawler.py
 
+import os
+import shutil
 import requests
 import json
 from datetime import date
@@ -25,17 +27,38 @@ def fetch_filename():
 
 def download_xls(filename):
     download_url = f"https://aomp109.judicial.gov.tw/judbp/wkw//WHD1A02/DOWNLOAD?fileName={filename}"
-    response = requests.get(download_url)
     
     current_date = date.today()
     filename = current_date.strftime("%Y%m%d") + ".xls"
     
-    if response.status_code == 200:
-        with open(filename, "wb") as file:
-            file.write(response.content)
-        print(f"Downloaded: {filename}")
-    else:
-        print("Failed to download XLS file.")
+    # stream to disk instead of holding the whole file in memory; write to a temp file and
+    # only move it into place once complete, so a failed transfer never leaves a truncated .xls
+    tmp_filename = filename + ".tmp"
+    try:
+        # (connect, read) timeout: a stalled stream must not hang the cron job
+        with requests.get(download_url, stream=True, timeout=(10, 60)) as response:
+            if response.status_code != 200:
+                print("Failed to download XLS file.")
+                return
+            response.raw.decode_content = True
+            size = int(response.headers.get("content-length", 0))
+            fd = os.open(tmp_filename, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+            # preallocate when the size is known (posix_fallocate is POSIX-only)
+            if size and hasattr(os, "posix_fallocate"):
+                try:
+                    os.posix_fallocate(fd, 0, size)
+                except OSError:
+                    pass
+            with os.fdopen(fd, "wb") as file:
+                shutil.copyfileobj(response.raw, file, 1 << 20)
+                # content-length may be the compressed size; drop any preallocated tail
+                file.truncate()
+        os.replace(tmp_filename, filename)
+    except BaseException:
+        if os.path.exists(tmp_filename):
+            os.remove(tmp_filename)
+        raise
+    print(f"Downloaded: {filename}")
 
 if __name__ == "__main__":
     filename = fetch_filename()
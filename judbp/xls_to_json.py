@@ -1,41 +1,113 @@
 import argparse
-import json
 import os
 import re
 import sys
+from datetime import date
 from typing import Any, Dict, List
 
-import pandas as pd
+import orjson
+import xlrd
+
+# orjson writes UTF-8 directly (no ascii escaping)
+JSON_OPTIONS = orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS
+
+ORIENTS = ["records", "dict", "list", "split", "index"]
+MISSING_CELL_TYPES = (xlrd.XL_CELL_EMPTY, xlrd.XL_CELL_BLANK, xlrd.XL_CELL_ERROR)
 
 def safe_filename(name: str) -> str:
     s = re.sub(r"[^A-Za-z0-9._-]+", "_", name).strip("_")
     return s[:100] or "sheet"
 
-def to_json_serializable(df: pd.DataFrame, na_mode: str) -> pd.DataFrame:
+def missing_value(na_mode: str) -> Any:
     """
-    Convert NaN/NaT according to na_mode:
-    - "null": convert to None (-> JSON null)
-    - "empty": convert to empty string
-    - "nan": leave as-is (may become NaN which isn't valid JSON without special handling)
+    Value for an empty cell according to na_mode:
+    - "null": None (-> JSON null)
+    - "empty": empty string
+    - "nan": float NaN; orjson writes it as null, so the output is the same as "null"
     """
     if na_mode == "null":
-        return df.where(pd.notnull(df), None)
+        return None
     elif na_mode == "empty":
-        return df.fillna("")
+        return ""
     else:
-        # "nan": do nothing
-        return df
+        return float("nan")
+
+def typed_value(cell: xlrd.sheet.Cell, datemode: int) -> Any:
+    "Raw xlrd cell value with the typing pandas.read_excel applies (ints, datetimes, times, bools)."
+    ctype, value = cell.ctype, cell.value
+    if ctype == xlrd.XL_CELL_NUMBER and value.is_integer():
+        return int(value)
+    if ctype == xlrd.XL_CELL_DATE:
+        value = xlrd.xldate.xldate_as_datetime(value, datemode)
+        # time-only cells sit on the workbook's epoch day
+        if value.date() == (date(1904, 1, 1) if datemode else date(1899, 12, 31)):
+            return value.time()
+        return value
+    if ctype == xlrd.XL_CELL_BOOLEAN:
+        return bool(value)
+    return value
+
+def cell_value(cell: xlrd.sheet.Cell, datemode: int, na_mode: str, as_strings: bool) -> Any:
+    "Convert one xlrd cell to a JSON-friendly value."
+    if cell.ctype in MISSING_CELL_TYPES or (cell.ctype == xlrd.XL_CELL_TEXT and cell.value == ""):
+        return missing_value(na_mode)
+    value = typed_value(cell, datemode)
+    if as_strings or cell.ctype == xlrd.XL_CELL_DATE:
+        return str(value)
+    return value
+
+def sheet_header(sheet: xlrd.sheet.Sheet, datemode: int) -> List[Any]:
+    """
+    First row as column names, typed like pandas (e.g. a 2023 year header stays the int 2023).
+    Blank names become 'Unnamed: i' and duplicates get '.1', '.2' suffixes.
+    """
+    header: List[Any] = []
+    counts: Dict[Any, int] = {}
+    for i, cell in enumerate(sheet.row(0)):
+        name = typed_value(cell, datemode) if cell.value != "" else f"Unnamed: {i}"
+        if name in counts:
+            counts[name] += 1
+            name = f"{name}.{counts[name]}"
+        else:
+            counts[name] = 0
+        header.append(name)
+    return header
+
+def sheet_rows(sheet: xlrd.sheet.Sheet, datemode: int, na_mode: str, as_strings: bool) -> List[List[Any]]:
+    "Data rows (after the header), skipping rows where every cell is empty."
+    rows = []
+    for r in range(1, sheet.nrows):
+        cells = sheet.row(r)
+        if all(c.ctype in MISSING_CELL_TYPES or c.value == "" for c in cells):
+            continue
+        row = [cell_value(c, datemode, na_mode, as_strings) for c in cells]
+        # short rows are padded so every row lines up with the header
+        row += [missing_value(na_mode)] * (sheet.ncols - len(row))
+        rows.append(row)
+    return rows
+
+def shape_rows(header: List[Any], rows: List[List[Any]], orient: str) -> Any:
+    "Arrange rows like pandas DataFrame.to_dict(orient=...) would."
+    if orient == "records":
+        return [dict(zip(header, row)) for row in rows]
+    if orient == "dict":
+        return {col: {i: row[j] for i, row in enumerate(rows)} for j, col in enumerate(header)}
+    if orient == "list":
+        return {col: [row[j] for row in rows] for j, col in enumerate(header)}
+    if orient == "split":
+        return {"index": list(range(len(rows))), "columns": header, "data": rows}
+    # "index"
+    return {i: dict(zip(header, row)) for i, row in enumerate(rows)}
 
 def main():
     parser = argparse.ArgumentParser(description="Convert .xls to .json (per-sheet + combined).")
     parser.add_argument("xls_path", help="Path to the .xls file")
     parser.add_argument("--outdir", default=".", help="Output directory (default: current dir)")
-    parser.add_argument("--orient", default="records",
-                        help="pandas DataFrame.to_dict orient (default: records). "
-                             "Common options: records, dict, list, split, index, columns, table")
+    parser.add_argument("--orient", default="records", choices=ORIENTS,
+                        help="Output shape, as in pandas DataFrame.to_dict orient (default: records)")
     parser.add_argument("--na", default="null", choices=["null", "empty", "nan"],
-                        help='How to output empty cells: "null" (JSON null), "empty" (""), or "nan" (leave as NaN). '
-                             'Default: null')
+                        help='How to output empty cells: "null" (JSON null), "empty" (""), or "nan" (kept for compatibility; '
+                             'NaN is not valid JSON, so it is written as null too). Default: null')
     parser.add_argument("--strings", action="store_true",
                         help="Try to read all cells as strings to preserve leading zeros, IDs, etc.")
     args = parser.parse_args()
@@ -53,8 +125,7 @@ def main():
     os.makedirs(outdir, exist_ok=True)
 
     try:
-        # engine for .xls should be xlrd (installed via pip)
-        xls = pd.ExcelFile(xls_path)
+        wb = xlrd.open_workbook(xls_path, on_demand=True)
     except Exception as e:
         print("Failed to open XLS. Make sure 'xlrd' is installed (pip install xlrd).", file=sys.stderr)
         raise
@@ -62,30 +133,25 @@ def main():
     combined: Dict[str, Any] = {}
     created_files: List[str] = []
 
-    for sheet_name in xls.sheet_names:
-        # dtype=str to preserve leading zeros if requested
-        parse_kwargs = {"dtype": str} if as_strings else {}
-        df = xls.parse(sheet_name, **parse_kwargs)
-
-        # Normalize empty cells per user choice
-        df = to_json_serializable(df, na_mode)
-
-        # Convert to list-of-dicts or other shape, based on orient
-        if orient == "records":
-            data_obj = df.to_dict(orient="records")
+    for sheet_name in wb.sheet_names():
+        sheet = wb.sheet_by_name(sheet_name)
+        if sheet.nrows == 0:
+            data_obj = shape_rows([], [], orient)
         else:
-            data_obj = df.to_dict(orient=orient)
+            # rows are read straight from xlrd; empty cells are normalized per --na as they are read
+            data_obj = shape_rows(sheet_header(sheet, wb.datemode), sheet_rows(sheet, wb.datemode, na_mode, as_strings), orient)
+        wb.unload_sheet(sheet_name)
 
         combined[sheet_name] = data_obj
 
         out_path = os.path.join(outdir, f"{safe_filename(sheet_name)}.json")
-        with open(out_path, "w", encoding="utf-8") as f:
-            json.dump(data_obj, f, ensure_ascii=False, indent=2)
+        with open(out_path, "wb") as f:
+            f.write(orjson.dumps(data_obj, option=JSON_OPTIONS))
         created_files.append(out_path)
 
     combined_path = os.path.join(outdir, "combined_sheets.json")
-    with open(combined_path, "w", encoding="utf-8") as f:
-        json.dump(combined, f, ensure_ascii=False, indent=2)
+    with open(combined_path, "wb") as f:
+        f.write(orjson.dumps(combined, option=JSON_OPTIONS))
     created_files.append(combined_path)
 
     print("Created JSON files:")